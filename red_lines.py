@@ -1,14 +1,55 @@
 import numpy as np
-import random
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib.path import Path
+from matplotlib.collections import PolyCollection
 import matplotlib
-import json
+from numba import njit
+import orjson
+import ijson
+import logging
+import pandas as pd
 import os
 import re
-random.seed(17)
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+@njit(cache=True, fastmath=True, boundscheck=False, nogil=True)
+def pip_mask(ring, bbox, points, out):
+    """
+    Marks which points fall inside a polygon using the PNPOLY crossing test.
+
+    Parameters
+    ----------
+    ring : ndarray of shape (n_vertices, 2)
+        Polygon vertices.
+    bbox : tuple of float
+        xmin, ymin, xmax, ymax of the ring, used to skip the crossing test.
+    points : ndarray of shape (n_points, 2)
+        Point coordinates to test.
+    out : ndarray of uint8
+        Filled with 1 for points inside the polygon and 0 otherwise.
+    """
+    nvert = ring.shape[0]
+    xmin, ymin, xmax, ymax = bbox
+    for k in range(points.shape[0]):
+        x = points[k, 0]
+        y = points[k, 1]
+        inside = False
+        if xmin <= x <= xmax and ymin <= y <= ymax:
+            j = nvert - 1
+            for i in range(nvert):
+                xi, yi = ring[i, 0], ring[i, 1]
+                xj, yj = ring[j, 0], ring[j, 1]
+                if ((yi > y) != (yj > y)) and (x < (xj - xi) * (y - yi) / (yj - yi) + xi):
+                    inside = not inside
+                j = i
+        out[k] = inside
+
 
 class DetroitDistrict:
     """
@@ -22,6 +63,8 @@ class DetroitDistrict:
         Coordinates defining the district boundaries from the json file
         Note that some districts are non-contiguous, which may
         effect the structure of this attribute
+        Stored as a contiguous float64 array of shape (n, 2); rings that cannot form
+        such an array are kept as given and skipped by generateRandPoint
 
     holcGrade : str
         The HOLC grade of the district.
@@ -47,6 +90,9 @@ class DetroitDistrict:
     censusTract : str, optional
         Census tract code for the district (default is None).
 
+    rank : int, optional
+        Rank of the district by median income, 1 being the highest, filled by calcRank (default is None).
+
 
     Attributes
     ------------------------------
@@ -66,11 +112,28 @@ class DetroitDistrict:
     self.randomLong 
     self.medIncome 
     self.censusTract 
+    self.rank 
 
 
     """
-    def __init__(self, coordinates, holcGrade, id, description, holcColor = None, randomLat=None, randomLong=None, medIncome=None, censusTract=None):
-        self.coordinates = coordinates
+    __slots__ = ('coordinates', 'holcGrade', 'id', 'description', 'holcColor', 'randomLat', 'randomLong',
+                 'medIncome', 'censusTract', 'rank', '_bbox', '_ring')
+
+    def __init__(self, coordinates, holcGrade, id, description, holcColor = None, randomLat=None, randomLong=None, medIncome=None, censusTract=None, rank=None):
+        # Validate the ring once here and keep its bounding box and a float32 copy for generateRandPoint
+        self._ring = None
+        try:
+            self.coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+        except (ValueError, TypeError):
+            # Non-contiguous districts can nest their rings unevenly; keep them as given and skip sampling
+            self.coordinates = coordinates
+            self._bbox = None
+        else:
+            if self.coordinates.ndim == 2 and self.coordinates.shape[1] == 2 and len(self.coordinates) > 0:
+                self._bbox = tuple(np.concatenate([self.coordinates.min(0), self.coordinates.max(0)]).tolist())
+                self._ring = self.coordinates.astype(np.float32)
+            else:
+                self._bbox = None
         self.holcGrade = holcGrade
         self.id = id
         self.description = description
@@ -78,6 +141,7 @@ class DetroitDistrict:
         self.randomLong = randomLong
         self.medIncome = medIncome
         self.censusTract = censusTract
+        self.rank = rank
 
         color_map = {
             'A': 'darkgreen',
@@ -106,10 +170,30 @@ class RedLines:
         assign districts attribute to an empty list
         """
         self.districts = []
+        self._rng = np.random.default_rng(17)
+        # Share pooled connections across the API calls and retry transient server errors
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                                                    max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504],
+                                                                      raise_on_status=False)))
         if cacheFile:
             self.loadCache(cacheFile)
+        self._sync_arrays()
+
+    def __del__(self):
+        self._session.close()
         
 
+    def _sync_arrays(self):
+        """
+        Copies the grade and median income of every district into column arrays
+        so group statistics and ranks can be computed with vectorized NumPy operations.
+        Grades are stored as uint8 0-3 for A-D and incomes as int32, with a missing median income as -1.
+        """
+        self._grades = np.array([ord(district.holcGrade) - ord('A') for district in self.districts], dtype=np.uint8)
+        self._incomes = np.array([district.medIncome if district.medIncome is not None else -1
+                                  for district in self.districts], dtype=np.int32)
+
     def createDistricts(self, fileName):
         """
         Creates DetroitDistrict instances from redlining data in a specified file.
@@ -129,33 +213,33 @@ class RedLines:
         one of the dict key with only number.
 
         """
-        with open(fileName, 'r') as f:
-            data = json.load(f)
-        
-        for district_data in data['features']:
-            properties = district_data['properties']
-            coordinates = district_data['geometry']['coordinates'][0]
-            district = DetroitDistrict(
-                coordinates=coordinates[0],
-                holcGrade=properties['holc_grade'],
-                id=properties['holc_id'],
-                description=properties['area_description_data']['8']
-            )
-            self.districts.append(district)
+        # Stream one feature at a time instead of loading the whole collection
+        with open(fileName, 'rb') as f:
+            for district_data in ijson.items(f, 'features.item', use_float=True):
+                properties = district_data['properties']
+                coordinates = district_data['geometry']['coordinates'][0]
+                district = DetroitDistrict(
+                    coordinates=coordinates[0],
+                    holcGrade=properties['holc_grade'],
+                    id=properties['holc_id'],
+                    description=properties['area_description_data']['8']
+                )
+                self.districts.append(district)
 
     def plotDistricts(self):
         """
         Plots the districts using matplotlib, displaying each district's location and color.
         Name it redlines_graph.png and save it to the current directory. 
         """
+        plt.rcParams["figure.figsize"] = (15, 15)
         fig, ax = plt.subplots()
-        
-        for district in self.districts: 
-            polygon = patches.Polygon(district.coordinates, closed=True, edgecolor='black', facecolor=district.holcColor)
-            ax.add_patch(polygon)
-            ax.autoscale()
 
-        plt.rcParams["figure.figsize"] = (15, 15)
+        # Draw every district as one collection and autoscale once
+        polygons = PolyCollection([district.coordinates for district in self.districts],
+                                  facecolors=[district.holcColor for district in self.districts], edgecolors='black')
+        ax.add_collection(polygons)
+        ax.autoscale_view()
+
         plt.show()
         fig.savefig('redlining/redlines_graph.png')
 
@@ -179,22 +263,48 @@ class RedLines:
         """
         xgrid = np.arange(-83.5, -82.8, 0.004)
         ygrid = np.arange(42.1, 42.6, 0.004)
-        xmesh, ymesh = np.meshgrid(xgrid, ygrid)
-        points = np.vstack((xmesh.flatten(), ymesh.flatten())).T
 
-        for district in self.districts:
-            if isinstance(district.coordinates, list) and all(isinstance(coord, list) and len(coord) == 2 for coord in district.coordinates):
-                polygon_path = Path(district.coordinates)
-                inside_grid = polygon_path.contains_points(points)
-                valid_points = points[inside_grid]
-                if valid_points.size > 0:
-                    point = random.choice(valid_points)
-                    district.randomLong = point[0]
-                    district.randomLat = point[1]
-                    print(district, " : ", point)
-  
-        
-    def fetchCensus(self):
+        n_districts = len(self.districts)
+
+        # Districts are independent and pip_mask releases the GIL, so sample them in parallel when
+        # there is more than one core; each district draws from its own child generator so the
+        # result is the same whichever way it runs.
+        rngs = self._rng.spawn(n_districts)
+
+        def pick(d):
+            district = self.districts[d]
+            if district._bbox is None:
+                return
+            # Only test the part of the grid inside the district's bounding box
+            xmin, ymin, xmax, ymax = district._bbox
+            i0, i1 = np.searchsorted(xgrid, [xmin, xmax])
+            j0, j1 = np.searchsorted(ygrid, [ymin, ymax])
+            if i0 == i1 or j0 == j1:
+                return
+            # Build the subgrid points in one float32 allocation, row by row
+            nx, ny = i1 - i0, j1 - j0
+            points = np.empty((nx * ny, 2), dtype=np.float32)
+            points[:, 0] = np.tile(xgrid[i0:i1], ny)
+            points[:, 1] = np.repeat(ygrid[j0:j1], nx)
+            inside_grid = np.empty(points.shape[0], dtype=np.uint8)
+            pip_mask(district._ring, district._bbox, points, inside_grid)
+            valid_idx = np.flatnonzero(inside_grid)
+            if valid_idx.size > 0:
+                row, col = divmod(valid_idx[rngs[d].integers(valid_idx.shape[0])], nx)
+                district.randomLong = xgrid[i0 + col]
+                district.randomLat = ygrid[j0 + row]
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("%s : (%s, %s)", district.id, district.randomLong, district.randomLat)
+
+        workers = os.cpu_count() or 1
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(pick, range(n_districts)))
+        else:
+            for d in range(n_districts):
+                pick(d)
+
+    def fetchCensus(self, cacheFile=None):
 
         """
         Fetches the census tract for each district in the list of districts using the FCC API.
@@ -222,21 +332,56 @@ class RedLines:
         'lat': xxx,'lon': xxx,'censusYear': xxx,'format': 'json' Or
         'lat': xxx,'lon': xxx,'censusYear': xxx
 
+        Parameters
+        ----------
+        cacheFile : str, optional
+            JSON file mapping "lat,lon" keys to census tracts from earlier runs, so that
+            districts whose random point has not changed skip the API call.
+            Defaults to None, which always queries the API.
+
         """
         base_url = "https://geo.fcc.gov/api/census/area"
-        for district in self.districts:
-            if district.randomLat is not None and district.randomLong is not None:
-                params = {
-                    'lat': district.randomLat,
-                    'lon': district.randomLong,
-                    'censusYear': '2010',
-                    'format': 'json'
-                }
-                response = requests.get(base_url, params=params)
+        tract_cache = {}
+        if cacheFile and os.path.exists(cacheFile):
+            with open(cacheFile, 'rb') as file:
+                tract_cache = orjson.loads(file.read())
+
+        def fetch(district):
+            key = f"{round(district.randomLat, 6)},{round(district.randomLong, 6)}"
+            if key in tract_cache:
+                district.censusTract = tract_cache[key]
+                return
+            params = {
+                'lat': district.randomLat,
+                'lon': district.randomLong,
+                'censusYear': '2010',
+                'format': 'json'
+            }
+            # A failed request or a malformed body only costs this district its tract
+            try:
+                response = self._session.get(base_url, params=params)
                 if response.status_code == 200:
                     data = response.json()
                     if 'results' in data and len(data['results']) > 0:
                         district.censusTract = data['results'][0]['block_fips'][2:11]
+                        tract_cache[key] = district.censusTract
+            except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+                logger.warning("Census tract lookup failed for district %s: %s", district.id, e)
+
+        # The lookups are independent and network bound, so run them concurrently
+        pending = [district for district in self.districts
+                   if district.randomLat is not None and district.randomLong is not None]
+        try:
+            with ThreadPoolExecutor(max_workers=32) as executor:
+                list(executor.map(fetch, pending))
+        finally:
+            # Keep whatever was fetched even if the batch was interrupted
+            if cacheFile:
+                try:
+                    with open(cacheFile, 'wb') as file:
+                        file.write(orjson.dumps(tract_cache))
+                except OSError as e:
+                    logger.warning("Failed to cache census tracts: %s", e)
 
     def fetchIncome(self):
 
@@ -264,26 +409,27 @@ class RedLines:
             'key': key
         }
 
-        response = requests.get(base_url, params=params)
+        response = self._session.get(base_url, params=params)
         if response.status_code == 200:
             data = response.json()
-            income_data = {item[2] + item[3]: int(item[0]) if item[0] != '-666666666' else 0 for item in data[1:]}
-            print(income_data)
-            for district in self.districts:
-                if district.censusTract in income_data:
-                    district.medIncome = income_data[district.censusTract]
-                    print(f"Updated district {district.id} with median income: {district.medIncome}")
-                else:
-                    district.medIncome = 0
-                    print(f"No data available for district {district.id}, setting median income to 0")
+            df = pd.DataFrame(data[1:], columns=['income', 'state', 'county', 'tract'])
+            income = pd.to_numeric(df['income'], errors='coerce').fillna(0).astype('int64')
+            income_data = pd.Series(income.where(income != -666666666, 0).to_numpy(), index=df['county'] + df['tract'])
+            tracts = pd.Index([district.censusTract for district in self.districts])
+            incomes = income_data.reindex(tracts, fill_value=0).to_numpy()
+            for district, income in zip(self.districts, incomes.tolist()):
+                district.medIncome = income
+            matched = tracts.isin(income_data.index).sum()
+            logger.info("Updated median income for %d of %d districts, the rest set to 0", matched, len(self.districts))
         else:
-            print(f"Failed to fetch income data with status code {response.status_code}: {response.text}")
+            logger.warning("Failed to fetch income data with status code %s: %s", response.status_code, response.text)
 
     def cacheData(self, fileName):
         """
         Saves the current state of district data to a file in JSON format.
-        Using the __dict__ magic method on each district instance, and save the 
-        result of it to a list.
+        DetroitDistrict uses __slots__, so each district is converted to a dict of its public
+        slot values and saved to a list; orjson serializes the NumPy
+        coordinate arrays directly.
         After creating the list, dump it to a json file with the inputted name.
         You should name the cache file as redlines_cache.json
 
@@ -292,10 +438,11 @@ class RedLines:
         filename : str
             The name of the file where the district data will be saved.
         """
-        districts_data = [district.__dict__ for district in self.districts]
+        districts_data = [{slot: getattr(district, slot) for slot in DetroitDistrict.__slots__ if not slot.startswith('_')}
+                          for district in self.districts]
     
-        with open(fileName, 'w') as file:
-            json.dump(districts_data, file)
+        with open(fileName, 'wb') as file:
+            file.write(orjson.dumps(districts_data, option=orjson.OPT_SERIALIZE_NUMPY))
 
         print(f"Data cached to {fileName}")
 
@@ -313,10 +460,20 @@ class RedLines:
         -------
         bool
             True if the data was successfully loaded, False otherwise.
+            A cache written before a district attribute existed (e.g. one without rank)
+            counts as a miss, so the pipeline reruns and fills the newer fields.
         """
+        if not os.path.exists(fileName):
+            return False
         try:
-            with open(fileName, 'r') as file:
-                districts_data = json.load(file)
+            with open(fileName, 'rb') as file:
+                districts_data = orjson.loads(file.read())
+
+            fields = {slot for slot in DetroitDistrict.__slots__ if not slot.startswith('_')}
+            missing = set().union(*(fields - data.keys() for data in districts_data))
+            if missing:
+                print(f"Cache {fileName} is missing {', '.join(sorted(missing))}, ignoring it")
+                return False
             
             self.districts.clear()
             for data in districts_data:
@@ -344,16 +501,13 @@ class RedLines:
         list
             A list containing mean and median income values for each district grade in the order A, B, C, D.
         """
-        income_grades = {'A': [], 'B': [], 'C': [], 'D': []}
-        for district in self.districts:
-            if district.medIncome is not None:
-                income_grades[district.holcGrade].append(district.medIncome)
-
+        self._sync_arrays()
         income_stats = []
-        for grade in ['A', 'B', 'C', 'D']:
-            if income_grades[grade]:
-                mean_income = np.mean(income_grades[grade])
-                median_income = np.median(income_grades[grade])
+        for grade in range(4):
+            incomes = self._incomes[(self._grades == grade) & (self._incomes >= 0)]
+            if incomes.size > 0:
+                mean_income = np.mean(incomes)
+                median_income = np.median(incomes)
                 income_stats.extend([round(mean_income), round(median_income)])
             else:
                 income_stats.extend([0, 0])
@@ -387,28 +541,24 @@ class RedLines:
 
         """
         # List of common filler words to exclude, you could add more if needed.
-        filler_words = set(['the', 'of', 'and', 'in', 'to', 'a', 'is', 'for', 'on', 'that'])
-        descriptions = {'A': '', 'B': '', 'C': '', 'D': ''}
+        filler_words = frozenset(['the', 'of', 'and', 'in', 'to', 'a', 'is', 'for', 'on', 'that'])
+        word_re = re.compile(r"\b[a-z']+\b")
+
+        # Count every grade's words in a single pass over the districts
+        word_counts = {grade: Counter() for grade in ['A', 'B', 'C', 'D']}
         for district in self.districts:
-            descriptions[district.holcGrade] += ' ' + district.description
-        
-        # Initialize a dictionary to hold word frequencies for each grade
-        common_words = {}
-        for grade, text in descriptions.items():
-            words = re.findall(r'\b\w+\b', text.lower())
-            word_counts = {}
-            for word in words:
-                if word not in filler_words:
-                    if word in word_counts:
-                        word_counts[word] += 1
-                    else:
-                        word_counts[word] = 1
-
-            # Sorting words by their counts and extracting the top 10
-            sorted_words = sorted(word_counts.items(), key=lambda item: item[1], reverse=True)
-            common_words[grade] = [word for word, count in sorted_words[:10]]
-
-        return [common_words[grade] for grade in ['A', 'B', 'C', 'D']]
+            # Whole words only, so "4th" and "B-2" do not leave "th" or "b" behind
+            words = word_re.findall(district.description.lower())
+            word_counts[district.holcGrade].update(word for word in words if len(word) > 1 and word not in filler_words)
+
+        # A word frequent in another grade is not unique to this one
+        top_words = {grade: {word for word, count in counts.most_common(50)} for grade, counts in word_counts.items()}
+        common_words = []
+        for grade, counts in word_counts.items():
+            shared = set().union(*(words for other, words in top_words.items() if other != grade))
+            common_words.append([word for word, count in counts.most_common() if word not in shared][:10])
+
+        return common_words
     
     def calcRank(self):
         """
@@ -432,9 +582,12 @@ class RedLines:
         rank
 
         """
-        
-
-        pass
+        self._sync_arrays()
+        order = np.argsort(-self._incomes, kind='stable')
+        ranks = np.empty_like(order)
+        ranks[order] = np.arange(1, len(order) + 1)
+        for district, rank in zip(self.districts, ranks.tolist()):
+            district.rank = rank
 
     def calcPopu(self):
         """
@@ -476,16 +629,18 @@ class RedLines:
 # Use main function to test your class implementations.
 # Feel free to modify the example main function.
 def main():
+    logging.basicConfig(level=logging.INFO)
     myRedLines = RedLines()
-    myRedLines.createDistricts('redlining/redlines_data.json')
+    # Only rebuild the districts and call the APIs when there is no cache yet
+    if not myRedLines.loadCache('redlining/redlines_cache.json'):
+        myRedLines.createDistricts('redlining/redlines_data.json')
+        myRedLines.generateRandPoint()
+        myRedLines.fetchCensus('redlining/fcc_cache.json')
+        myRedLines.fetchIncome()
+        myRedLines.calcRank()
+        myRedLines.calcPopu()
+        myRedLines.cacheData('redlining/redlines_cache.json')
     myRedLines.plotDistricts()
-    myRedLines.generateRandPoint()
-    myRedLines.fetchCensus()
-    myRedLines.fetchIncome()
-    myRedLines.calcRank()  # Assuming you have this method
-    myRedLines.calcPopu()  # Assuming you have this method
-    myRedLines.cacheData('redlining/redlines_cache.json')
-    myRedLines.loadCache('redlining/redlines_cache.json')
     # Add any other function calls as needed
 
 if __name__ == '__main__':